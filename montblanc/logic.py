@@ -1,7 +1,9 @@
 """A script to check the availability of refuges on the Tour du Mont Blanc.
 
-The script uses a cache to avoid querying the same date multiple times. The cache is refreshed every
-`REFRESH_TIMEOUT` seconds. The cache is stored in memory, so it will be lost when the program exits.
+The script checks the refuges every `REFRESH_TIMEOUT` seconds, give or take `REFRESH_JITTER`, starting
+each check `PREFETCH_LEAD` seconds before the wait is over. Statuses are cached for `CACHE_TIMEOUT`
+seconds, so that one check doesn't query the same date twice. The cache is stored in memory, so it will be
+lost when the program exits.
 
 Usage:
     >> check_refuges(
@@ -11,45 +13,226 @@ Usage:
         ],
         datetime(2024, 9, 11),
     )
-    Waiting to check availability: 59 [##############################################] 100%
-    Waiting to check availability: 59 [##############################################] 100%
-    Waiting to check availability: 59 [##############################################] 100%
-    Refuge 32367 has 4 places left on Saturday, Sep 11, 2024!
+        Les Chambres du Soleil: Not available on Saturday, Sep 11, 2024
+    !!! Auberge-Refuge de la Nova: 4 places left on Saturday, Sep 11, 2024 !!!
+
+    Next check at 14:32:05
+    Waiting to check availability: ██████████████████████▋
 """
 
-import json
+import asyncio
+import io
 import logging
+import math
 import os
+import random
 import re
+import sys
+import threading
 import time
-import winsound
-from collections import defaultdict
+import wave
+from array import array
+from dataclasses import asdict
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List
 
 import httpx
+import orjson
 import times
-from bs4 import BeautifulSoup
+from cachetools import LRUCache
 from cachetools.func import ttl_cache
-from tqdm import tqdm
 
 from montblanc.refuges import (
     Refuge,
     du_lac_blanc,
 )
 
+if TYPE_CHECKING:
+    from tqdm import tqdm
+
 logging.basicConfig(level=logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+_REFUGE_ID_RE = re.compile(r"refuge_i(\d+)")
+
+# How dates are shown to the user, and how they are sent to the booking system and stored in plans
+_DATE_FMT = r"%A, %b %d, %Y"
+_DATESTR_FMT = r"%Y-%m-%d"
+
+# The refuges listed on montourdumontblanc.com (`#tabsrefuges div.refuge`), and their links and names
+_REFUGES_XPATH = (
+    "//*[@id='tabsrefuges']//div[contains(concat(' ', normalize-space(@class), ' '), ' refuge ')]"
+)
+_REFUGE_HREF_XPATH = "string((.//a)[1]/@href)"
+_REFUGE_NAME_XPATH = (
+    "string((.//div[contains(concat(' ', normalize-space(@class), ' '), ' bloccontenurefuge ')]//h3)[1])"
+)
+
+CACHE_DIR = Path.home() / ".montblanc" / "cache"
+
+_CLEAR_SCREEN = "\x1b[2J\x1b[H"
+
+# The number of seconds between updates of the waiting bar. The process is otherwise idle while waiting,
+# so the bar only wakes it up every few seconds.
+_BAR_STEP = 5
+
+# The availability of a refuge on a date, or the exception raised while getting it
+Result = tuple[datetime, Refuge, dict | Exception]
+
+
+def _clear_terminal():
+    """Clear the terminal with ANSI escape sequences, instead of spawning a shell to run cls/clear."""
+    if not _enable_ansi():
+        os.system("cls")
+        return
+
+    sys.stdout.write(_CLEAR_SCREEN)
+    sys.stdout.flush()
+
+
+@lru_cache(maxsize=1)
+def _enable_ansi() -> bool:
+    """Enable ANSI escape sequences in the terminal, if needed.
+
+    Returns:
+        bool: Whether the terminal supports ANSI escape sequences. Only consoles older than Windows 10
+            don't.
+    """
+    if os.name != "nt":
+        return True
+
+    import ctypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+    mode = ctypes.c_ulong()
+    if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+        return False
+
+    # ENABLE_VIRTUAL_TERMINAL_PROCESSING, which older consoles reject
+    return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))
+
+
+@lru_cache(maxsize=512)
+def _format_date(date: datetime) -> str:
+    """Format a date for display. Cached, since the same few dates are printed on every refresh."""
+    return date.strftime(_DATE_FMT)
+
+
+@lru_cache(maxsize=1)
+def _alert_wav() -> bytes:
+    """Build the alert sound as an in-memory WAV file.
+
+    The sound is 5 rounds of 3 bursts of 4 short 440 Hz beeps, as one buffer so that it can be played
+    with a single call instead of one `winsound.Beep` per beep.
+    """
+    rate = 8000
+    beep = array("h", (int(12000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(rate // 10)))
+
+    def silence(seconds: float) -> bytes:
+        return bytes(2 * int(rate * seconds))
+
+    burst = (beep.tobytes() + silence(0.05)) * 4 + silence(0.5)
+    frames = (burst * 3 + silence(1)) * 5
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(frames)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=512)
+def _isoformat(date: datetime) -> str:
+    """Format a date as YYYY-MM-DD. Cached, since the same date is queried for many refuges."""
+    return date.strftime(_DATESTR_FMT)
+
+
+def _parse_jsonp(buf: bytes) -> Any:
+    """Parse the JSON payload of a JSONP response body, without decoding it to a string first.
+
+    The payload is the outermost object, so it is sliced out between the first `{` and the last `}`,
+    which also drops the array some responses wrap it in.
+    """
+    return orjson.loads(buf[buf.find(b"{") : buf.rfind(b"}") + 1])
+
+
+@lru_cache(maxsize=1)
+def _refuge_xpaths() -> tuple[Callable, Callable, Callable]:
+    """Compile the XPath expressions of `_parse_refuges`, so they aren't recompiled for every refuge."""
+    from lxml import etree
+
+    return etree.XPath(_REFUGES_XPATH), etree.XPath(_REFUGE_HREF_XPATH), etree.XPath(_REFUGE_NAME_XPATH)
+
+
+def _parse_refuges(html: bytes, encoding: str | None = None) -> list[Refuge]:
+    """Parse the names and IDs of the refuges listed on the montourdumontblanc.com home page.
+
+    Args:
+        html (bytes): The undecoded page
+        encoding (str, optional): The encoding from the response headers. Defaults to the one the page
+            declares itself.
+    """
+    import lxml.html
+
+    tree = lxml.html.fromstring(html, parser=lxml.html.HTMLParser(encoding=encoding))
+    find_refuges, find_href, find_name = _refuge_xpaths()
+
+    refuges = []
+
+    for refuge in find_refuges(tree):
+        _id = _REFUGE_ID_RE.search(find_href(refuge))
+        if not _id:
+            continue
+        _id = int(_id.group(1))
+
+        # A plain str, as lxml's string results keep the whole parsed page alive
+        name = str(find_name(refuge))
+        logger.debug(f"Refuge {name} ID is {_id}")
+        refuges.append(Refuge(id=_id, name=name))
+
+    return refuges
+
+
+def _read_cache(key: str, ttl: int) -> Any:
+    """Read a value from the on-disk cache.
+
+    Args:
+        key (str): The name of the cached value
+        ttl (int): The maximum age of the cached value, in seconds
+
+    Returns:
+        Any: The cached value, or None if it is missing, unreadable or older than `ttl`.
+    """
+    path = CACHE_DIR / f"{key}.json"
+    try:
+        if time.time() - path.stat().st_mtime > ttl:
+            return None
+        return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_cache(key: str, value: Any):
+    """Write a JSON-serializable value to the on-disk cache."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (CACHE_DIR / f"{key}.json").write_bytes(orjson.dumps(value))
+    except OSError:
+        logger.warning(f"Could not write {key} to the cache at {CACHE_DIR}")
+
 
 class Montblanc:
     """A class for querying the availability of refuges on the Tour du Mont Blanc.
 
-    The class uses a cache to avoid querying the same date multiple times. The cache is refreshed every
-    `REFRESH_TIMEOUT` seconds. The cache is stored in memory, so it will be lost when the program exits.
+    The class caches statuses for `CACHE_TIMEOUT` seconds, so that one check doesn't query the same date
+    twice. The cache is stored in memory, so it will be lost when the program exits.
 
     The Refuge ID for any given refuge can be found by inspecting the URL of the refuge's page on the
     Mont Blanc website. For example, the refuge ID for the Auberge-Refuge de la Nova is 32367, and the
@@ -57,26 +240,70 @@ class Montblanc:
     The refuge ID is the number after `refuge_i` in the URL.
 
     Attributes:
-        REFRESH_TIMEOUT (int): The number of seconds to wait before refreshing the cache. Defaults to 60.
+        REFRESH_TIMEOUT (int): The number of seconds to wait between checks. Defaults to 300.
+        REFRESH_JITTER (int): The maximum number of seconds by which each wait between refreshes is
+            randomly shortened or lengthened, so that clients don't all poll at the same moment.
+            Defaults to 30.
+        MAX_CONCURRENCY (int): The maximum number of status queries in flight at once, so checking a
+            whole region doesn't flood the booking system. Defaults to 10.
+        CACHE_TIMEOUT (int): The number of seconds a queried status is reused for, so that the days of a
+            plan covered by one query aren't queried again in the same refresh. Defaults to 30.
+        AVAILABILITY_SIZE (int): The maximum number of (refuge, date) statuses kept in memory. The least
+            recently used ones are dropped first. Defaults to 1024.
+        PREFETCH_LEAD (int): The number of seconds before the end of each wait at which the next refresh
+            is started, so its results are ready when the wait is over. Defaults to 10.
 
     Usage:
         >> mb = Montblanc()
-        >> mb.alert_on_availability(datetime(2024, 9, 11), 32367, 3)
+        >> asyncio.run(mb.check_refuge(datetime(2024, 9, 11), mb.refuge_by_id(32367), 3))
         Refuge 32367 has 4 places left on Saturday, Sep 11, 2024
     """
 
     REFRESH_TIMEOUT = times.FIVE_MINUTES
+    REFRESH_JITTER = 30
+    MAX_CONCURRENCY = 10
+    CACHE_TIMEOUT = times.THIRTY_SECONDS
+    AVAILABILITY_SIZE = 1024
+    PREFETCH_LEAD = times.TEN_SECONDS
 
-    def __init__(self):
-        self.client = httpx.Client()
-        self.availability = defaultdict(dict)
-        self.get_refuge_names()
+    # Held while the alert is playing
+    _noise_lock = threading.Lock()
 
-    @ttl_cache(maxsize=100, ttl=REFRESH_TIMEOUT)
-    def _query_status(self, date: datetime, refuge_id: int) -> dict:
+    def __init__(self):
+        # Only used for the refuge list and regions, which are larger pages than the status queries
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            timeout=httpx.Timeout(10.0),
+        )
+        # Status queries are small, so a slow one is better reported as an error than waited on
+        self.aclient = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONCURRENCY, max_keepalive_connections=self.MAX_CONCURRENCY
+            ),
+            timeout=httpx.Timeout(5.0),
+        )
+        # Created on first use, inside the running event loop
+        self._sem: asyncio.Semaphore | None = None
+        # The status of each (refuge ID, date), filled in by `_query_status` and read by `get_availability`.
+        # Bounded, since every query adds a window of days and a long-running check never stops querying.
+        self.availability: LRUCache = LRUCache(maxsize=self.AVAILABILITY_SIZE)
+
+        # Lookup tables for the refuges, rebuilt whenever `get_refuge_names` refreshes
+        self._by_id: dict[int, Refuge] = {}
+        self._by_name: dict[str, Refuge] = {}
+        self._by_name_lower: dict[str, Refuge] = {}
+
+        # The width of the refuge name column when printing, also set by `get_refuge_names` and widened by
+        # `_poll` to fit the refuges it prints
+        self._name_col_width = 0
+
+    async def _query_status(self, date: datetime, refuge_id: int) -> dict:
         """Query the status of a refuge on a given date.
 
-        Do not call this method directly. Instead, use `get_availability` for the caching.
+        This always queries the booking system, and stores every day of its answer in
+        `self.availability`. Use `get_availability` to make use of the cache.
 
         Args:
             date (datetime): The date to query
@@ -91,31 +318,46 @@ class Montblanc:
                 "places": 4,
                 "closed": False,
                 "retrieved": datetime(2021, 8, 1, 12, 0, 0),
+                "retrieved_monotonic": 1234.5,  # `time.monotonic()` when retrieved, for the cache
                 "bookable": True,  # If the booking system is even open yet.
             }
         """
-        logger.debug(f"Querying {refuge_id} on {date.strftime(r'%A, %b %d, %Y')}")
-        datestr = date.strftime(r"%Y-%m-%d")
+        await self._fetch_statuses(date, refuge_id)
+        return self.availability[(refuge_id, date)]
 
-        r = self.client.get(
-            "https://etape-rest.for-system.com/index.aspx/index.aspx",
-            params={"ref": "json-planning-refuge", "q": f"{refuge_id},{datestr}"},
-        )
+    async def _fetch_statuses(self, date: datetime, refuge_id: int):
+        """Query a refuge from `date` on, and store every day of the answer in `self.availability`.
+
+        Unlike `_query_status`, this doesn't fail if `date` itself is missing from the answer.
+        """
+        logger.debug(f"Querying {refuge_id} on {_format_date(date)}")
+        datestr = _isoformat(date)
+
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.MAX_CONCURRENCY)
+
+        async with self._sem:
+            r = await self.aclient.get(
+                "https://etape-rest.for-system.com/index.aspx/index.aspx",
+                params={"ref": "json-planning-refuge", "q": f"{refuge_id},{datestr}"},
+            )
         r.raise_for_status()
-        response = json.loads(r.text.strip("()[]")).get("planning", list())
+        response = _parse_jsonp(r.content).get("planning", list())
 
+        now = datetime.now()
+        # For `_cached_status`, which must not be fooled by the wall clock changing
+        now_monotonic = time.monotonic()
         for item in response:
             d = date + timedelta(days=item["d"])
-            self.availability[refuge_id][d] = {
+            self.availability[(refuge_id, d)] = {
                 "places": item["s"],
                 "closed": item["f"] == 1,
-                "retrieved": datetime.now(),
+                "retrieved": now,
+                "retrieved_monotonic": now_monotonic,
                 "bookable": True,
             }
 
-        return self.availability[refuge_id][date]
-
-    def get_availability(self, date: datetime, refuge: Refuge) -> dict:
+    async def get_availability(self, date: datetime, refuge: Refuge) -> dict:
         """Get the availability of a refuge on a given date.
 
         This method will return the cached availability if it is available and not stale.
@@ -136,53 +378,115 @@ class Montblanc:
             }
         """
         # Check if the availability is cached and not stale
-        if (
-            refuge.id in self.availability
-            and date in self.availability[refuge.id]
-            and self.availability[refuge.id][date]["retrieved"]
-            > datetime.now() - timedelta(seconds=self.REFRESH_TIMEOUT)
-            and True
-        ):
-            return self.availability[date]
+        cached = self._cached_status(refuge.id, date)
+        if cached:
+            return cached
 
         if refuge.special:
-            return refuge.check_availability()
+            return await asyncio.to_thread(refuge.check_availability)
+
+        return await self._query_status(date, refuge_id=refuge.id)
+
+    def _cached_status(self, refuge_id: int, date: datetime) -> dict | None:
+        """Get the cached status of a refuge on a date, or None if it is missing or stale."""
+        cached = self.availability.get((refuge_id, date))
+        if cached and time.monotonic() - cached["retrieved_monotonic"] < self.CACHE_TIMEOUT:
+            return cached
+        return None
+
+    async def prefetch_refuge(self, refuge_id: int, start_date: datetime):
+        """Query the availability of a refuge from `start_date` onwards into `self.availability`.
+
+        The booking system answers every query with a window of days, so a single query per refuge is
+        enough to cover every day of a plan that falls within it.
+
+        Args:
+            refuge_id (int): The ID of the refuge to query
+            start_date (datetime): The first date to query
+        """
+        await self._fetch_statuses(start_date, refuge_id)
+
+    async def _check_many(self, pairs: list[tuple[datetime, Refuge]]) -> list[dict | Exception]:
+        """Get the availability of many (date, refuge) pairs concurrently.
 
-        return self._query_status(date, refuge_id=refuge.id)
+        Each distinct pair is only queried once, even if it appears in `pairs` several times.
+
+        Args:
+            pairs (list[tuple[datetime, Refuge]]): The dates and refuges to query
+
+        Returns:
+            list[dict | Exception]: The availability for each pair, in the same order as `pairs`. If a
+                query failed, the exception is returned in its place instead of being raised.
+        """
+        unique = list(dict.fromkeys(pairs))
+        results = await asyncio.gather(
+            *[self.get_availability(date, refuge) for date, refuge in unique],
+            return_exceptions=True,
+        )
+        by_pair = dict(zip(unique, results, strict=True))
+        return [by_pair[pair] for pair in pairs]
 
     @ttl_cache(maxsize=1, ttl=times.ONE_DAY)  # 1 day
     def get_regions(self) -> list[dict[str, str]]:
-        """Get a list of regions and the IDs of refuges in them."""
+        """Get a list of regions and the IDs of refuges in them.
+
+        This is cached for 1 day, both in memory and on disk.
+        """
+        cached = _read_cache("regions", times.ONE_DAY)
+        if cached is not None:
+            return cached
+
         r = self.client.get(
             r"https://jsonp.open-system.fr/jsonp.aspx?px=http://www.montourdumontblanc.com/uk/json-listezonesgeo.xml",
         )
         r.raise_for_status()
-        response: list[dict[str, str]] = json.loads(r.text.strip("()[]\r\n ;"))["ListeId"]
+        response: list[dict[str, str]] = _parse_jsonp(r.content)["ListeId"]
         for loc in response:
             loc["Nom"] = loc["Nom"].replace("&nbsp;", "'").strip("- '")
             loc["Id"] = loc["Id"].strip().split(",")
             loc["Id"] = [int(i) for i in loc["Id"]]
 
+        _write_cache("regions", response)
         return response
 
-    def alert_on_availability(
+    async def check_refuge(
         self, date: datetime, refuge: Refuge, min_places: int = 3, silent: bool = False
     ) -> bool:
-        """Print an alert if there are more than `min_places` places available at `refuge_id` on `date`"""
-        try:
-            availability = self.get_availability(date, refuge)
-        except Exception:
+        """Get the availability of `refuge` on `date`, and print it with `alert_on_availability`.
+
+        Returns:
+            bool: Whether places were found
+        """
+        [availability] = await self._check_many([(date, refuge)])
+        return self.alert_on_availability(date, refuge, min_places, silent, availability=availability)
+
+    def alert_on_availability(
+        self,
+        date: datetime,
+        refuge: Refuge,
+        min_places: int = 3,
+        silent: bool = False,
+        *,
+        availability: dict | Exception,
+    ) -> bool:
+        """Print an alert if there are more than `min_places` places available at `refuge_id` on `date`
+
+        `availability` is the result of `get_availability` for the refuge and date, or the exception
+        raised while getting it. Use `check_refuge` to get it and print the alert in one go.
+        """
+        if isinstance(availability, Exception):
             print(f"### Error while checking {refuge.name}")
             return False
 
-        m_len = max([len(r.name) for r in self.get_refuge_names()])
+        m_len = self._name_col_width
+        date_str = _format_date(date)
 
         if not availability:
             print(f"    {refuge.name.rjust(m_len)}: No availability information available. Try again later.")
             return False
 
         if availability["closed"]:
-            print(f"    {refuge.name.rjust(m_len)}: Closed on {date.strftime(r'%A, %b %d, %Y')}")
+            print(f"    {refuge.name.rjust(m_len)}: Closed on {date_str}")
             return False
 
         if not availability["bookable"]:
@@ -191,7 +495,7 @@ class Montblanc:
 
         if availability["places"] and availability["places"] > min_places:
             print(
-                f"!!! {refuge.name.rjust(m_len)}: {availability['places']} places left on {date.strftime(r'%A, %b %d, %Y')} !!!"
+                f"!!! {refuge.name.rjust(m_len)}: {availability['places']} places left on {date_str} !!!"
             )
             if not silent:
                 self._make_noise()
@@ -202,54 +506,83 @@ class Montblanc:
                 f"!!! {refuge.name.rjust(m_len)}: Check not possible, but it looks like booking is open! !!!"
             )
 
-        print(f"    {refuge.name.rjust(m_len)}: Not available on {date.strftime(r'%A, %b %d, %Y')}")
+        print(f"    {refuge.name.rjust(m_len)}: Not available on {date_str}")
         return False
 
     def _make_noise(self):
-        """Make a noise to alert the user."""
-        for _ in range(5):
-            for _ in range(3):
-                for _ in range(4):
-                    winsound.Beep(440, 100)
-                    time.sleep(0.05)
-                time.sleep(0.5)
-            time.sleep(1)
+        """Make a noise to alert the user, without blocking the caller while it plays.
+
+        If the alert is already playing, this does nothing, so overlapping alerts don't pile up.
+        """
+        if not self._noise_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._beep_pattern, daemon=True).start()
+
+    def _beep_pattern(self):
+        """Play the alert beeps, then release `_noise_lock`. This blocks for about 20 seconds.
+
+        Without winsound, i.e. not on Windows, the terminal bell is rung once instead.
+        """
+        try:
+            try:
+                import winsound
+            except ImportError:
+                # Not on Windows, so fall back to the terminal bell
+                sys.stdout.write("\a")
+                sys.stdout.flush()
+                return
+
+            # winsound can't play from memory asynchronously, which is why this runs on its own thread
+            winsound.PlaySound(_alert_wav(), winsound.SND_MEMORY)
+        finally:
+            self._noise_lock.release()
 
     @ttl_cache(maxsize=1, ttl=times.ONE_DAY)
     def get_refuge_names(self) -> list[Refuge]:
         """Get the names and IDs of all refuges on montourdumontblanc.com.
 
-        This is cached for 1 day.
+        This is cached for 1 day, both in memory and on disk.
 
         Returns:
             list[Refuge]: A list of refuges
         """
-        r = httpx.get("https://www.montourdumontblanc.com/uk/index.aspx")
-        r.raise_for_status()
-
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        refuges = []
-
-        refuge_tabs = soup.find("div", {"id": "tabsrefuges"})
-        listings = refuge_tabs.find_all("div", {"class": "refuge"})
-        for refuge in listings:
-            href = refuge.find("a").get("href")
-            _id = re.search(r"refuge_i(\d+)", href)
-            if not _id:
-                continue
-            _id = _id.group(1)
-
-            name = refuge.find("div", {"class": "bloccontenurefuge"}).h3.text
-            logger.debug(f"Refuge {name} ID is {_id}")
-            refuges.append(Refuge(id=_id, name=name))
+        cached = _read_cache("refuges", times.ONE_DAY)
+        if cached is not None:
+            refuges = [Refuge(**r) for r in cached]
+        else:
+            refuges = self._scrape_refuges()
+            _write_cache("refuges", [asdict(r) for r in refuges])
 
         refuges.extend(self.get_special_refuges())
 
         logger.info(f"Found {len(refuges)} refuges")
         refuges.sort(key=lambda x: x.name)
+
+        self._by_id = {r.id: r for r in refuges}
+        self._by_name = {r.name: r for r in refuges}
+        self._by_name_lower = {r.name.lower(): r for r in refuges}
+        self._name_col_width = max(len(r.name) for r in refuges)
         return refuges
 
+    def _scrape_refuges(self) -> list[Refuge]:
+        """Scrape the names and IDs of all refuges from montourdumontblanc.com.
+
+        Do not call this method directly. Instead, use `get_refuge_names` for the caching.
+
+        Returns:
+            list[Refuge]: A list of refuges, not including the special refuges
+        """
+        return _parse_refuges(*self._fetch_html("https://www.montourdumontblanc.com/uk/index.aspx"))
+
+    def _fetch_html(self, url: str) -> tuple[bytes, str | None]:
+        """Get the HTML of a page undecoded, along with the encoding from the response headers, if any.
+
+        The page is left for lxml to decode, as it can't parse decoded pages that declare an encoding.
+        """
+        r = self.client.get(url)
+        r.raise_for_status()
+        return r.content, r.charset_encoding
+
     def get_special_refuges(self) -> list[Refuge]:
         """Get the names and IDs of all special refuges (not on montourdumontblanc.com).
 
@@ -259,7 +592,7 @@ class Montblanc:
             list[Refuge]: A list of refuges
         """
         refuges = [
-            du_lac_blanc.refuge(),
+            du_lac_blanc.refuge(client=self.client),
         ]
         return refuges
 
@@ -275,13 +608,15 @@ class Montblanc:
         Raises:
             ValueError: If the refuge cannot be found
         """
-        for refuge in self.get_refuge_names():
-            if refuge.name == refuge_name:
-                return refuge
+        self.get_refuge_names()  # Refreshes the lookup tables if they are stale
+        name_lower = refuge_name.lower()
+        refuge = self._by_name.get(refuge_name) or self._by_name_lower.get(name_lower)
+        if refuge:
+            return refuge
 
         # Fuzzier search
-        for refuge in self.get_refuge_names():
-            if refuge_name.lower() in refuge.name.lower():
+        for lower, refuge in self._by_name_lower.items():
+            if name_lower in lower:
                 return refuge
 
         raise ValueError(f"Could not find refuge with name {refuge_name}")
@@ -296,14 +631,23 @@ class Montblanc:
             Refuge: A refuge object. If the refuge cannot be found, a refuge object with the ID and name
                 "Unknown Refuge (refuge_id)" will be returned.
         """
-        for refuge in self.get_refuge_names():
-            if refuge.id == refuge_id:
-                return refuge
+        self.get_refuge_names()  # Refreshes the lookup tables if they are stale
+        refuge = self._by_id.get(refuge_id)
+        if refuge:
+            return refuge
 
         return Refuge(id=refuge_id, name=f"Unknown Refuge ({refuge_id})")
 
 
-mb = Montblanc()
+_mb: Montblanc | None = None
+
+
+def get_mb() -> Montblanc:
+    """Get the shared Montblanc instance, creating it on first use."""
+    global _mb
+    if _mb is None:
+        _mb = Montblanc()
+    return _mb
 
 
 def check_refuges(
@@ -329,33 +673,43 @@ def check_refuges(
     for refuge in refuges:
         ref_objs.append(convert_refuge(refuge))
 
-    while True:
-        # Clear the terminal
-        os.system("cls||clear")
+    pairs = [(date, refuge) for refuge in ref_objs]
+    asyncio.run(_poll(partial(_check_pairs, pairs), min_places, silent))
+
+
+async def _check_pairs(pairs: list[tuple[datetime, Refuge]]) -> list[Result]:
+    """Get the availability of (date, refuge) pairs once, querying all of them concurrently."""
+    results = await get_mb()._check_many(pairs)
+    return [
+        (date, refuge, availability)
+        for (date, refuge), availability in zip(pairs, results, strict=True)
+    ]
 
-        # Check the availability of each refuge
-        for refuge in ref_objs:
-            mb.alert_on_availability(date, refuge, min_places, silent=silent)
 
-        # Wait for the refresh timeout
-        sleep_with_waiting_bar()
+_CONVERTERS: dict[type, Callable[[Any], Refuge]] = {
+    int: lambda refuge: get_mb().refuge_by_id(refuge),
+    str: lambda refuge: get_mb().refuge_by_name(refuge),
+    dict: lambda refuge: Refuge(**refuge),
+}
 
 
 def convert_refuge(refuge: int | str | dict | Refuge):
     """Convert a refuge (given as an Int, Str, dict or Refuge) to a Refuge object."""
-    try:
-        refuge = int(refuge)
-    except (ValueError, TypeError):
-        pass
-
-    if isinstance(refuge, int):
-        return mb.refuge_by_id(refuge)
-    elif isinstance(refuge, Refuge):
+    if isinstance(refuge, Refuge):
         return refuge
-    elif isinstance(refuge, dict):
-        return Refuge.model_validate(refuge)
-    else:
-        return mb.refuge_by_name(refuge)
+
+    # Refuge IDs given on the command line arrive as strings
+    if isinstance(refuge, str):
+        number = refuge.strip()
+        unsigned = number[1:] if number[:1] in ("+", "-") else number
+        # isdecimal, not isdigit, which also accepts characters like "²" that int() rejects
+        if unsigned.isdecimal():
+            refuge = int(number)
+
+    converter = _CONVERTERS.get(type(refuge))
+    if converter is None:
+        raise TypeError(f"Cannot convert {type(refuge).__name__} {refuge!r} to a refuge")
+    return converter(refuge)
 
 
 def check_region(region: str, date: datetime, min_places: int = 3, silent: bool = False):
@@ -370,36 +724,123 @@ def check_region(region: str, date: datetime, min_places: int = 3, silent: bool
         min_places (int, optional): The minimum number of places available to trigger an alert. Defaults to 3.
         silent (bool, optional): If True, no noise will be made when availability is found. Defaults to False.
     """
+    mb = get_mb()
+
+    # The refuges of a region don't change during a run, so they are only looked up once
+    pairs = [
+        (date, mb.refuge_by_id(refuge_id))
+        for refuge in mb.get_regions()
+        if region in refuge["Nom"]
+        for refuge_id in refuge["Id"]
+    ]
+    asyncio.run(_poll(partial(_check_pairs, pairs), min_places, silent))
+
 
+async def _poll(fetch: Callable[[], Awaitable[list[Result]]], min_places: int, silent: bool):
+    """Print the availability returned by `fetch` forever, refreshing it every Montblanc.REFRESH_TIMEOUT.
+
+    The next refresh runs in the background during the wait, so its results can be printed as soon as
+    the wait is over instead of after another round of queries.
+    """
+    mb = get_mb()
+    await _stagger_start()
+    results = await fetch()
     while True:
-        # Clear the terminal
-        os.system("cls||clear")
+        _clear_terminal()
+
+        # Refuges given as objects or dicts never go through `get_refuge_names`, which sets the width
+        widest = max((len(refuge.name) for _, refuge, _ in results), default=0)
+        mb._name_col_width = max(mb._name_col_width, widest)
+
+        places_found = False
+        for date, refuge, availability in results:
+            places_found |= mb.alert_on_availability(
+                date, refuge, min_places, silent=True, availability=availability
+            )
+        if places_found and not silent:
+            mb._make_noise()
 
-        # Check the availability of each refuge
-        for refuge in mb.get_regions():
-            if region in refuge["Nom"]:
-                for refuge_id in refuge["Id"]:
-                    mb.alert_on_availability(date, mb.refuge_by_id(refuge_id), min_places, silent=silent)
+        # Start the next refresh shortly before the wait is over, so its results are still fresh
+        timeout = _jitter(Montblanc.REFRESH_TIMEOUT)
+        next_results = asyncio.create_task(_fetch_later(fetch, timeout - Montblanc.PREFETCH_LEAD))
+        await sleep_with_waiting_bar_async(timeout)
+        results = await next_results
 
-        # Wait for the refresh timeout
-        sleep_with_waiting_bar()
 
+async def _fetch_later(fetch: Callable[[], Awaitable[list[Result]]], delay: float) -> list[Result]:
+    """Call `fetch` after waiting `delay` seconds."""
+    await asyncio.sleep(delay)
+    return await fetch()
 
-def sleep_with_waiting_bar(timeout: int = mb.REFRESH_TIMEOUT):
-    """Print a waiting bar to the terminal.
+
+async def sleep_with_waiting_bar_async(timeout: int = Montblanc.REFRESH_TIMEOUT):
+    """Print a waiting bar to the terminal, without blocking the event loop while waiting.
+
+    The wait itself is a single `asyncio.sleep`, and the bar is advanced by a separate task, so other
+    coroutines can run during the wait.
 
     Args:
-        timeout (int, optional): The number of seconds to wait. Defaults to mb.REFRESH_TIMEOUT.
+        timeout (int, optional): The number of seconds to wait. Defaults to Montblanc.REFRESH_TIMEOUT.
     """
 
-    print("")
-    for _ in tqdm(
-        range(mb.REFRESH_TIMEOUT * 2),
+    _print_next_check(timeout)
+    with _waiting_bar(timeout) as bar:
+        ticker = asyncio.create_task(_tick(bar))
+        try:
+            await asyncio.sleep(timeout)
+        finally:
+            ticker.cancel()
+
+
+async def _tick(bar: "tqdm"):
+    """Advance a waiting bar every `_BAR_STEP` seconds, until cancelled."""
+    while True:
+        await asyncio.sleep(_BAR_STEP)
+        bar.update(_BAR_STEP)
+
+
+def _print_next_check(timeout: int):
+    """Print the time of the next check, which the waiting bar doesn't show."""
+    print(f"\nNext check at {datetime.now() + timedelta(seconds=timeout):%H:%M:%S}")
+
+
+def _jitter(timeout: int) -> int:
+    """Randomly shorten or lengthen a wait by up to Montblanc.REFRESH_JITTER seconds, to at least a minute."""
+    return max(60, timeout + random.randint(-Montblanc.REFRESH_JITTER, Montblanc.REFRESH_JITTER))
+
+
+async def _stagger_start():
+    """Wait a few random seconds before the first check, so clients started together don't poll together."""
+    await asyncio.sleep(random.uniform(0, 5))
+
+
+def _waiting_bar(timeout: int) -> "tqdm":
+    """Create a waiting bar for `timeout` seconds, to be advanced with `update`."""
+    from tqdm import tqdm
+
+    return tqdm(
+        total=timeout,
         leave=False,
         ncols=80,
-        bar_format="Waiting to check availability: {remaining} {bar}",
-    ):
-        time.sleep(0.5)
+        bar_format="Waiting to check availability: {bar}",
+    )
+
+
+def _load_refuge(saved: dict) -> Refuge | None:
+    """Rebuild a refuge saved in a plan, or None if it can't be found.
+
+    Refuges are rebuilt from their saved ID and name, so that loading a plan doesn't need the network.
+    Special refuges need their own class, and refuges saved without an ID or name are looked up.
+    """
+    if saved.get("special"):
+        return next((r for r in get_mb().get_special_refuges() if r.id == saved.get("id")), None)
+
+    if "id" in saved and "name" in saved:
+        return Refuge(id=saved["id"], name=saved["name"])
+
+    mb = get_mb()
+    mb.get_refuge_names()  # Refreshes the lookup tables if they are stale
+    return mb._by_id.get(saved.get("id")) or mb._by_name.get(saved.get("name"))
 
 
 class Plan:
@@ -417,7 +858,8 @@ class Plan:
         else:
             path = Path.home() / ".montblanc" / "default_plan.json"
 
-        self.days: dict[datetime, set[Refuge]] = defaultdict(set)
+        # Kept in insertion order; sorted by date wherever the days are shown or saved
+        self.days: dict[datetime, set[Refuge]] = {}
         self.path: Path = path
 
         self.load(path)
@@ -427,65 +869,117 @@ class Plan:
         if not self.days:
             raise ValueError("No days have been added to the plan. Use `add_day` to add days to the plan.")
 
-        while True:
-            # Clear the terminal
-            os.system("cls||clear")
+        asyncio.run(_poll(self._check_all, min_places, silent))
+
+    async def _check_all(self) -> list[Result]:
+        """Get the availability of every day and refuge in the plan once.
+
+        All queries of the plan are sent together, so a refresh takes about as long as its slowest query.
 
-            places_found = False
-            for day, refuges in self.days.items():
-                for refuge in refuges:
-                    if mb.alert_on_availability(day, refuge, min_places, silent=True):
-                        places_found = True
+        Returns:
+            list[tuple[datetime, Refuge, dict | Exception]]: The availability of each day and refuge, in
+                the order of the plan
+        """
+        mb = get_mb()
+        pairs = [(day, refuge) for day, refuges in sorted(self.days.items()) for refuge in refuges]
+
+        # Query each refuge once from the first day it is planned for, which covers its later days.
+        # Special refuges can't be prefetched, so they are queried alongside.
+        first_days: dict[int, datetime] = {}
+        special = []
+        for day, refuge in pairs:
+            if refuge.special:
+                special.append((day, refuge))
+            elif day < first_days.get(refuge.id, datetime.max):
+                first_days[refuge.id] = day
+
+        prefetch_results, special_results = await asyncio.gather(
+            asyncio.gather(
+                *[mb.prefetch_refuge(refuge_id, day) for refuge_id, day in first_days.items()],
+                return_exceptions=True,
+            ),
+            mb._check_many(special),
+        )
+        fetched = dict(zip(special, special_results, strict=True))
+
+        # A refuge whose prefetch request failed is reported as failed on all of its days, rather than queried
+        # again for each of them while the booking system is already struggling
+        failed = {
+            refuge_id: result
+            for refuge_id, result in zip(first_days, prefetch_results, strict=True)
+            if isinstance(result, Exception)
+        }
+        for day, refuge in pairs:
+            if refuge.id in failed and not refuge.special:
+                fetched[(day, refuge)] = failed[refuge.id]
+
+        # Only query the days the prefetch did not cover on their own
+        missing = [
+            (day, refuge)
+            for day, refuge in pairs
+            if (day, refuge) not in fetched and not mb._cached_status(refuge.id, day)
+        ]
+        fetched.update(zip(missing, await mb._check_many(missing), strict=True))
 
-            if places_found and not silent:
-                mb._make_noise()
+        results = []
+        for day, refuge in pairs:
+            if (day, refuge) in fetched:
+                availability = fetched[(day, refuge)]
+            else:
+                # Normally prefetched, unless a very large plan pushed it out of the cache again
+                availability = mb.availability.get((refuge.id, day))
+            results.append((day, refuge, availability))
 
-            sleep_with_waiting_bar()
+        return results
 
     def add_day(
         self,
         date: datetime,
         refuges: list[int | str | Refuge],
         print_refuges: bool = False,
+        save: bool = True,
     ):
         """Add a day to the plan. If the day already exists, the refuges will replace the existing day.
 
         Args:
             date (datetime): The date of the day
             refuges (list[int | str | Refuge]): A list of refuges to stay at on the given date
+            print_refuges (bool, optional): Whether to print the day's refuges. Defaults to False.
+            save (bool, optional): Whether to save the plan to its file afterwards. Defaults to True.
         """
         if not refuges:
             self.days.pop(date, None)
             if print_refuges:
-                print(f"Cleared {date.strftime(r'%A, %b %d, %Y')}")
-            self.save()
+                print(f"Cleared {_format_date(date)}")
+            if save:
+                self.save()
             return
 
         c_refuges = [convert_refuge(refuge) for refuge in refuges]
         self.days[date] = set(sorted(c_refuges, key=lambda x: x.name))
-        self.days = dict(sorted(self.days.items()))
 
         if print_refuges:
-            print(f"Added {date.strftime(r'%A, %b %d, %Y')}:")
+            print(f"Added {_format_date(date)}:")
             for refuge in c_refuges:
                 print(f"  - {refuge.name}")
 
-        self.save()
+        if save:
+            self.save()
 
     def save(self):
         """Save the plan to a file."""
         payload = {
             "days": [
                 {
-                    "date": day.strftime(r"%Y-%m-%d"),
-                    "refuges": [r.model_dump() for r in sorted(refuges, key=lambda x: x.name)],
+                    "date": _isoformat(day),
+                    "refuges": [asdict(r) for r in sorted(refuges, key=lambda x: x.name)],
                 }
-                for day, refuges in self.days.items()
+                for day, refuges in sorted(self.days.items())
             ]
         }
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w") as f:
-            json.dump(payload, f, indent=4)
+        with self.path.open("wb") as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
 
     def load(self, path: str):
         """Load a plan from a file.
@@ -495,18 +989,18 @@ class Plan:
         """
         path = Path(path)
         if not path.exists():
-            self.days = defaultdict(set)
+            self.days = {}
             return
 
-        with open(path, "r") as f:
-            payload = json.load(f)
+        with open(path, "rb") as f:
+            payload = orjson.loads(f.read())
 
         for day in payload["days"]:
             refuges = []
-            for cached_refuge in day["refuges"]:
-                for refuge in mb.get_refuge_names():
-                    if refuge.id == cached_refuge["id"] or refuge.name == cached_refuge["name"]:
-                        refuges.append(refuge)
-                        break
+            for saved_refuge in day["refuges"]:
+                refuge = _load_refuge(saved_refuge)
+                if refuge:
+                    refuges.append(refuge)
 
-            self.add_day(datetime.strptime(day["date"], r"%Y-%m-%d"), refuges)
+            # The file is already up to date, so don't write it back for every day
+            self.add_day(datetime.strptime(day["date"], _DATESTR_FMT), refuges, save=False)
@@ -11,7 +11,7 @@ app.add_typer(planner.app, name="plan")
 
 @app.command()
 def list():
-    names = logic.mb.get_refuge_names()
+    names = logic.get_mb().get_refuge_names()
     print(f"Found {len(names)} refuges:")
     for name in names:
         print(f"{str(name.id)+':':<8} {name.name}")
@@ -43,7 +43,7 @@ def day(
 @app.command()
 def show(path: types.plan_path_arg = None):
     plan = Plan(path)
-    for day, refuges in plan.days.items():
+    for day, refuges in sorted(plan.days.items()):
         print(f"{day.strftime(r'%A, %b %d, %Y')}:")
         for refuge in refuges:
             print(f"  - {refuge.name}")
@@ -1,13 +1,12 @@
-from typing import Literal
+from dataclasses import dataclass
 
-import pydantic
 
-
-class Refuge(pydantic.BaseModel):
+@dataclass(slots=True, frozen=True)
+class Refuge:
     id: int
     name: str
 
-    special: Literal[True, False] = False
+    special: bool = False
     """Whether the refuge is special, i.e. not found on montourdumontblanc.com."""
 
     def check_availability(self) -> bool:
@@ -25,6 +24,3 @@ class Refuge(pydantic.BaseModel):
         This method should be overridden by subclasses.
         """
         raise NotImplementedError
-
-    def __hash__(self) -> int:
-        return hash((self.id, self.name))
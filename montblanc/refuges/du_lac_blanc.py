@@ -7,8 +7,16 @@ from montblanc.refuges import Refuge
 
 # Create the refuge object
 class LacBlanc(Refuge):
-    def __init__(self):
-        super().__init__(name="Refuge du Lac Blanc", id="90001", special=True)
+    def __init__(self, client: httpx.Client | None = None):
+        """Create the refuge.
+
+        Args:
+            client (httpx.Client, optional): The client to check the booking page with, so its connections
+                can be reused. Defaults to a new client.
+        """
+        super().__init__(name="Refuge du Lac Blanc", id=90001, special=True)
+        # Not a dataclass field, so it isn't compared or hashed. Refuge is frozen, hence object.__setattr__.
+        object.__setattr__(self, "client", client if client is not None else httpx.Client())
 
     def check_availability(self) -> bool:
         """Check if there is availability at the refuge.
@@ -38,7 +46,7 @@ class LacBlanc(Refuge):
 
         # Get the booking page
         try:
-            r = httpx.get("https://refuge-lac-blanc.fr/en/booking/")
+            r = self.client.get("https://refuge-lac-blanc.fr/en/booking/")
             r.raise_for_status()
             # Check if the booking is open
             return "Reservations are not possible at this time" not in r.text